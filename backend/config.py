@@ -43,12 +43,42 @@ class Config:
     FAISS_PATH = os.path.join(INDEX_DIR, "gallery.index")
     LABELS_PATH = os.path.join(INDEX_DIR, "gallery_labels.npy")
     PATHS_PATH = os.path.join(INDEX_DIR, "gallery_paths.npy")
+    CLUSTERS_PATH = os.path.join(INDEX_DIR, "gallery_clusters.npy")
+    
+    # Versioned bundles: bundle/versions/<version>/{model,index,manifest.json}
+    # If bundle/versions/ does not exist, bundle/ itself is served as version "legacy"
+    VERSIONS_DIR = os.path.join(BUNDLE_DIR, "versions")
+    ACTIVE_POINTER_PATH = os.path.join(VERSIONS_DIR, "ACTIVE")
+    MANIFEST_NAME = "manifest.json"
+    LEGACY_VERSION = "legacy"
+    ACTIVE_BUNDLE = os.getenv("ACTIVE_BUNDLE", "")
+    
+    # Admin settings (admin endpoints are disabled when ADMIN_TOKEN is empty)
+    ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+    WARMUP_QUERIES = int(os.getenv("WARMUP_QUERIES", "3"))
     
     # API settings
     DEFAULT_K = int(os.getenv("DEFAULT_K", "5"))
     MAX_K = int(os.getenv("MAX_K", "100"))
     THUMBNAIL_MAX_SIZE = int(os.getenv("THUMBNAIL_MAX_SIZE", "320"))
     THUMBNAIL_QUALITY = int(os.getenv("THUMBNAIL_QUALITY", "85"))
+    THUMBNAIL_WEBP_QUALITY = int(os.getenv("THUMBNAIL_WEBP_QUALITY", "80"))
+    THUMBNAIL_AVIF_QUALITY = int(os.getenv("THUMBNAIL_AVIF_QUALITY", "60"))
+    # Server preference order for Accept negotiation (unsupported formats are skipped)
+    THUMBNAIL_FORMATS = [f.strip().lower() for f in os.getenv("THUMBNAIL_FORMATS", "avif,webp,jpeg").split(",")]
+    THUMBNAIL_ENCODER_WORKERS = int(os.getenv("THUMBNAIL_ENCODER_WORKERS", "2"))
+    THUMBNAIL_CACHE_MAX_BYTES = int(os.getenv("THUMBNAIL_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+    
+    # Near-duplicate handling for compacted indexes: "collapse" or "expand"
+    DUPLICATES_MODE = os.getenv("DUPLICATES_MODE", "collapse").lower()
+    
+    # Approximate semantic result cache (keyed by query embedding)
+    RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE_ENABLED", "true").lower() == "true"
+    RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+    RESULT_CACHE_MAX_DISTANCE = float(os.getenv("RESULT_CACHE_MAX_DISTANCE", "0.02"))
+    RESULT_CACHE_MODE = os.getenv("RESULT_CACHE_MODE", "rescore").lower()  # "rescore" or "reuse"
+    RESULT_CACHE_LSH_BITS = int(os.getenv("RESULT_CACHE_LSH_BITS", "16"))
+    RESULT_CACHE_PROBES = int(os.getenv("RESULT_CACHE_PROBES", "2"))
     
     # Server settings
     BACKEND_HOST = os.getenv("BACKEND_HOST", "0.0.0.0")
@@ -70,15 +100,58 @@ class Config:
     AWS_REGION = os.getenv("AWS_REGION", "us-east-1")
     
     @staticmethod
-    def validate():
+    def bundle_dir(version: str) -> str:
+        """Get the directory of a bundle version"""
+        versioned = os.path.join(Config.VERSIONS_DIR, version)
+        if version == Config.LEGACY_VERSION and not os.path.isdir(versioned):
+            return Config.BUNDLE_DIR
+        return versioned
+    
+    @staticmethod
+    def bundle_paths(version: str) -> dict:
+        """Get model/index file paths of a bundle version"""
+        root = Config.bundle_dir(version)
+        return {
+            "root": root,
+            "manifest": os.path.join(root, Config.MANIFEST_NAME),
+            "model_arch": os.path.join(root, "model", "arch.json"),
+            "model_weights": os.path.join(root, "model", "weights.pt"),
+            "faiss": os.path.join(root, "index", "gallery.index"),
+            "labels": os.path.join(root, "index", "gallery_labels.npy"),
+            "paths": os.path.join(root, "index", "gallery_paths.npy"),
+            "clusters": os.path.join(root, "index", "gallery_clusters.npy"),
+        }
+    
+    @staticmethod
+    def initial_version() -> str:
+        """Resolve the bundle version to serve on startup"""
+        if Config.ACTIVE_BUNDLE:
+            return Config.ACTIVE_BUNDLE
+        if os.path.exists(Config.ACTIVE_POINTER_PATH):
+            with open(Config.ACTIVE_POINTER_PATH, "r") as f:
+                version = f.read().strip()
+            if version:
+                return version
+        return Config.LEGACY_VERSION
+    
+    @staticmethod
+    def validate(version: str = None):
         """Validate configuration - check required files exist"""
+        if version is None:
+            version = Config.initial_version()
+        paths = Config.bundle_paths(version)
         required_files = [
-            Config.MODEL_ARCH_PATH,
-            Config.FAISS_PATH,
-            Config.LABELS_PATH,
-            Config.PATHS_PATH,
+            paths["model_arch"],
+            paths["faiss"],
+            paths["labels"],
+            paths["paths"],
         ]
         
         for path in required_files:
             if not os.path.exists(path):
                 raise RuntimeError(f"Required file not found: {path}")
+        
+        if Config.DUPLICATES_MODE not in ("collapse", "expand"):
+            raise RuntimeError(f"DUPLICATES_MODE must be 'collapse' or 'expand', got '{Config.DUPLICATES_MODE}'")
+        if Config.RESULT_CACHE_MODE not in ("rescore", "reuse"):
+            raise RuntimeError(f"RESULT_CACHE_MODE must be 'rescore' or 'reuse', got '{Config.RESULT_CACHE_MODE}'")
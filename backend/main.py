@@ -9,19 +9,31 @@ import os
 import time
 
 from config import Config
-from models.embedding import EmbeddingModel
-from models.faiss_index import FAISSIndex
-from routes import search, health, thumbnails
+from models.bundle_manager import BundleManager
+from models.result_cache import SemanticResultCache
+from routes import search, health, thumbnails, admin
 
-# Initialize models (global instances)
-embedding_model = EmbeddingModel()
-faiss_index = FAISSIndex()
+# Initialize bundle manager (global instance, holds the active model + index)
+bundle_manager = BundleManager()
+
+# Approximate result cache, cleared whenever a new bundle goes live
+result_cache = None
+if Config.RESULT_CACHE_ENABLED:
+    result_cache = SemanticResultCache(
+        max_bytes=Config.RESULT_CACHE_MAX_BYTES,
+        max_distance=Config.RESULT_CACHE_MAX_DISTANCE,
+        n_bits=Config.RESULT_CACHE_LSH_BITS,
+        n_probes=Config.RESULT_CACHE_PROBES,
+    )
+    bundle_manager.add_swap_listener(result_cache.invalidate)
 
 # Inject into modules
-search.embedding_model = embedding_model
-search.faiss_index = faiss_index
-health.faiss_index = faiss_index
-thumbnails.faiss_index = faiss_index
+search.bundle_manager = bundle_manager
+search.result_cache = result_cache
+health.bundle_manager = bundle_manager
+health.result_cache = result_cache
+thumbnails.bundle_manager = bundle_manager
+admin.bundle_manager = bundle_manager
 
 
 def create_app():
@@ -31,21 +43,16 @@ def create_app():
     
     # Validate configuration
     t0 = time.time()
-    Config.validate()
+    version = Config.initial_version()
+    Config.validate(version)
     print(f" Config validation: {time.time() - t0:.2f}s")
     
     # Load models
     print("=" * 50)
-    print("Initializing Image Search API...")
+    print(f"Initializing Image Search API (bundle {version})...")
     print("=" * 50)
     
-    t0 = time.time()
-    embedding_model.load()
-    print(f" Embedding model load: {time.time() - t0:.2f}s")
-    
-    t0 = time.time()
-    faiss_index.load(embedding_model.emb_dim)
-    print(f" FAISS index load: {time.time() - t0:.2f}s")
+    bundle_manager.load_initial(version)
     
     # Create app
     app = FastAPI(
@@ -68,6 +75,7 @@ def create_app():
     app.include_router(health.router)
     app.include_router(search.router)
     app.include_router(thumbnails.router)
+    app.include_router(admin.router)
     
     # Mount static files (must be last)
     public_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "public"))
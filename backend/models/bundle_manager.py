@@ -0,0 +1,365 @@
+# backend/models/bundle_manager.py
+"""
+Versioned model + index bundles with zero-downtime hot-swap.
+
+Each bundle version lives in bundle/versions/<version>/ and carries a
+manifest.json (model hash, index type, dimension, count). Requests acquire
+the active bundle for their whole lifetime, so a swap never pulls the model
+or index out from under an in-flight request; the old bundle is released
+once its last reference is dropped.
+"""
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+import faiss
+import numpy as np
+from PIL import Image
+
+from config import Config
+from models.embedding import EmbeddingModel
+from models.faiss_index import FAISSIndex
+
+
+def file_sha256(path: str) -> str:
+    """Hash a file in chunks (weights files are several hundred MB)"""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def build_manifest(version: str) -> dict:
+    """Build a manifest for a bundle version from the files on disk"""
+    paths = Config.bundle_paths(version)
+    index = faiss.read_index(paths["faiss"])
+    manifest = {
+        "version": version,
+        "model_sha256": file_sha256(paths["model_weights"]) if os.path.exists(paths["model_weights"]) else None,
+        "index_type": type(index).__name__,
+        "dim": int(index.d),
+        "ntotal": int(index.ntotal),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    }
+    return manifest
+
+
+def read_manifest(version: str) -> dict:
+    """Read the manifest of a bundle version (None if the bundle has none)"""
+    manifest_path = Config.bundle_paths(version)["manifest"]
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path, "r") as f:
+        return json.load(f)
+
+
+class Bundle:
+    """A loaded model + index pair for one bundle version, with reference counting"""
+
+    def __init__(self, version: str, manifest: dict):
+        self.version = version
+        self.manifest = manifest
+        self.embedding_model = EmbeddingModel()
+        self.faiss_index = FAISSIndex()
+        self.loaded_at = None
+        self.retired = False
+        self._refs = 0
+        self._lock = threading.Lock()
+
+    @property
+    def refs(self) -> int:
+        return self._refs
+
+    def load(self):
+        """Load model and index, then verify them against the manifest"""
+        paths = Config.bundle_paths(self.version)
+
+        t0 = time.time()
+        if not self.embedding_model.load(paths["model_arch"], paths["model_weights"]):
+            raise RuntimeError(f"Failed to load embedding model for bundle {self.version}")
+        print(f" [{self.version}] Embedding model load: {time.time() - t0:.2f}s")
+
+        t0 = time.time()
+        self.faiss_index.load(self.embedding_model.emb_dim, paths["faiss"], paths["labels"], paths["paths"],
+                              paths["clusters"])
+        print(f" [{self.version}] FAISS index load: {time.time() - t0:.2f}s")
+
+        self._verify_metadata()
+        if self.manifest is None:
+            # No manifest on disk: describe what was loaded instead of re-reading and re-hashing it
+            print(f" [{self.version}] No manifest, skipping manifest checks")
+            self.manifest = self._loaded_manifest()
+        else:
+            self._verify_manifest(paths)
+        self.loaded_at = time.time()
+
+    def _loaded_manifest(self) -> dict:
+        index = self.faiss_index.index
+        return {
+            "version": self.version,
+            "model_sha256": None,
+            "index_type": type(index).__name__,
+            "dim": int(index.d),
+            "ntotal": int(index.ntotal),
+            "generated": True,
+        }
+
+    def _verify_metadata(self):
+        """Check labels/paths line up with the index"""
+        index = self.faiss_index.index
+        if len(self.faiss_index.labels) != self.faiss_index.gallery_size:
+            raise ValueError("Labels and paths arrays differ in length")
+        if self.faiss_index.members is None and self.faiss_index.gallery_size != index.ntotal:
+            raise ValueError("Metadata arrays do not match index size")
+        if self.faiss_index.members is not None:
+            # Compacted bundle: the index must hold exactly the cluster representatives, by gallery id
+            if index.ntotal != len(self.faiss_index.members):
+                raise ValueError(f"Index holds {index.ntotal} vectors but cluster table has "
+                                 f"{len(self.faiss_index.members)} representatives")
+            if not hasattr(index, "id_map"):
+                raise ValueError("Compacted bundle index must be an IndexIDMap")
+            ids = faiss.vector_to_array(index.id_map)
+            if len(ids) and (ids.min() < 0 or ids.max() >= self.faiss_index.gallery_size):
+                raise ValueError("Index ids fall outside the gallery")
+            if set(ids.tolist()) != set(self.faiss_index.members):
+                raise ValueError("Index ids do not match the cluster representatives in gallery_clusters.npy")
+
+    def _verify_manifest(self, paths: dict):
+        """Check the loaded artifacts match what the manifest on disk promises"""
+        m = self.manifest
+        index = self.faiss_index.index
+        if m.get("dim") is not None and int(m["dim"]) != index.d:
+            raise ValueError(f"Manifest dim {m['dim']} != index dim {index.d}")
+        if m.get("ntotal") is not None and int(m["ntotal"]) != index.ntotal:
+            raise ValueError(f"Manifest ntotal {m['ntotal']} != index ntotal {index.ntotal}")
+        if m.get("index_type") and m["index_type"] != type(index).__name__:
+            raise ValueError(f"Manifest index_type {m['index_type']} != {type(index).__name__}")
+        if m.get("model_sha256"):
+            # Without weights EmbeddingModel falls back to a random projection head
+            if not os.path.exists(paths["model_weights"]):
+                raise ValueError(f"Manifest has a model hash but {paths['model_weights']} is missing")
+            digest = file_sha256(paths["model_weights"])
+            if digest != m["model_sha256"]:
+                raise ValueError(f"Model hash mismatch: manifest {m['model_sha256'][:12]}, file {digest[:12]}")
+
+    def warmup(self, n_queries: int):
+        """Run test queries end to end so the first real request is not a cold one"""
+        rng = np.random.default_rng(0)
+        for i in range(n_queries):
+            pixels = rng.integers(0, 256, size=(224, 224, 3), dtype=np.uint8)
+            q = self.embedding_model.encode(Image.fromarray(pixels, "RGB"))
+            if q.shape != (1, self.faiss_index.index.d) or not np.all(np.isfinite(q)):
+                raise RuntimeError(f"Warmup query {i} produced invalid embedding {q.shape}")
+            D, I = self.faiss_index.search(q, Config.DEFAULT_K)
+            if I.shape[1] == 0 or I[0][0] < 0:
+                raise RuntimeError(f"Warmup query {i} returned no results")
+        print(f" [{self.version}] Warmed up with {n_queries} queries")
+
+    def acquire(self):
+        with self._lock:
+            self._refs += 1
+
+    def release(self):
+        with self._lock:
+            self._refs -= 1
+            drop = self.retired and self._refs == 0
+        if drop:
+            self.unload()
+
+    def unload(self):
+        """Free model and index memory"""
+        print(f" [{self.version}] Unloading bundle")
+        self.embedding_model = None
+        self.faiss_index = None
+
+    def info(self) -> dict:
+        return {
+            "version": self.version,
+            "manifest": self.manifest,
+            "loaded_at": self.loaded_at,
+            "refs": self._refs,
+        }
+
+
+class BundleManager:
+    """Holds the active bundle and swaps in new versions atomically"""
+
+    def __init__(self):
+        self.active = None
+        self.previous = None
+        self.staging = None
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._swap_listeners = []
+
+    def add_swap_listener(self, fn):
+        """Call fn(version) after every swap (e.g. to invalidate caches)"""
+        self._swap_listeners.append(fn)
+
+    def load_initial(self, version: str):
+        """Load the startup bundle synchronously"""
+        bundle = Bundle(version, read_manifest(version))
+        bundle.load()
+        with self._lock:
+            self.active = bundle
+        return bundle
+
+    @contextmanager
+    def acquire(self, version: str = None):
+        """
+        Pin a bundle for the duration of a request.
+
+        version=None pins the active bundle. A specific version resolves to
+        the active or previous bundle, so results from just before a swap
+        stay consistent; an unknown version raises KeyError.
+        """
+        with self._lock:
+            bundle = self.active
+            if version is not None and version != bundle.version:
+                if self.previous is not None and self.previous.version == version:
+                    bundle = self.previous
+                else:
+                    raise KeyError(version)
+            bundle.acquire()
+        try:
+            yield bundle
+        finally:
+            bundle.release()
+
+    @property
+    def active_version(self) -> str:
+        return self.active.version if self.active else None
+
+    @property
+    def is_loading(self) -> bool:
+        return self._load_lock.locked()
+
+    def stage(self, version: str):
+        """
+        Load, verify and warm up a bundle version, then swap it in.
+
+        Meant to run in the background; progress is reported via self.staging.
+        """
+        if not self._load_lock.acquire(blocking=False):
+            # Lost a race with another activation; keep reporting the load in progress
+            print(f" Not staging bundle {version}: another bundle is already loading")
+            if self.staging is not None:
+                self.staging["rejected"] = version
+            return
+        try:
+            self.staging = {"version": version, "state": "loading", "error": None, "started_at": time.time()}
+            try:
+                bundle = Bundle(version, read_manifest(version))
+                bundle.load()
+                self.staging["state"] = "warming"
+                bundle.warmup(Config.WARMUP_QUERIES)
+            except Exception as e:
+                print(f" Failed to stage bundle {version}: {e}")
+                self.staging.update(state="failed", error=str(e))
+                return
+            with self._lock:
+                old_previous = self._set_active(bundle)
+            self._after_swap(bundle, old_previous)
+            self.staging.update(state="active")
+        finally:
+            self._load_lock.release()
+
+    def rollback(self) -> str:
+        """Swap the previous bundle back in (it is kept loaded for this)"""
+        # Serialise with stage() and other rollbacks so previous can't be retired under us
+        if not self._load_lock.acquire(blocking=False):
+            raise RuntimeError("A bundle is loading, try again once it is active")
+        try:
+            with self._lock:
+                bundle = self.previous
+                if bundle is None or bundle.retired or bundle.embedding_model is None:
+                    raise RuntimeError("No previous bundle to roll back to")
+                old_previous = self._set_active(bundle)
+            self._after_swap(bundle, old_previous)
+            return bundle.version
+        finally:
+            self._load_lock.release()
+
+    def _set_active(self, bundle: Bundle) -> Bundle:
+        """
+        Make bundle active, keeping the old active as previous for rollback.
+
+        Caller holds self._lock; returns the displaced previous bundle.
+        """
+        old_previous = self.previous
+        self.previous = self.active
+        self.active = bundle
+        bundle.retired = False
+        if self.previous is not None:
+            self.previous.retired = False
+        return old_previous
+
+    def _after_swap(self, bundle: Bundle, old_previous: Bundle):
+        """Retire the displaced bundle, notify listeners and persist the active version"""
+        if old_previous is not None and old_previous is not bundle and old_previous is not self.previous:
+            self._retire(old_previous)
+        for fn in self._swap_listeners:
+            fn(bundle.version)
+        try:
+            self._write_pointer(bundle.version)
+        except OSError as e:
+            # e.g. read-only bundle volume: the swap stands, it just won't survive a restart
+            print(f" Could not persist active bundle {bundle.version}: {e}")
+        print(f" Active bundle: {bundle.version} (previous: {self.previous.version if self.previous else None})")
+
+    def _retire(self, bundle: Bundle):
+        """Unload a bundle once in-flight requests holding it have finished"""
+        with bundle._lock:
+            bundle.retired = True
+            drop = bundle._refs == 0
+        if drop:
+            bundle.unload()
+
+    def _write_pointer(self, version: str):
+        """Persist the active version so a restart comes back on it"""
+        if not os.path.isdir(Config.VERSIONS_DIR):
+            return
+        tmp = Config.ACTIVE_POINTER_PATH + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(version)
+        os.replace(tmp, Config.ACTIVE_POINTER_PATH)
+
+    def list_versions(self) -> list:
+        """List bundle versions available on disk"""
+        versions = set()
+        if os.path.isdir(Config.VERSIONS_DIR):
+            versions.update(
+                d for d in os.listdir(Config.VERSIONS_DIR)
+                if os.path.isdir(os.path.join(Config.VERSIONS_DIR, d))
+            )
+        if os.path.exists(Config.bundle_paths(Config.LEGACY_VERSION)["faiss"]):
+            versions.add(Config.LEGACY_VERSION)
+        return sorted(versions)
+
+    def status(self) -> dict:
+        return {
+            "active": self.active.info() if self.active else None,
+            "previous": self.previous.info() if self.previous else None,
+            "staging": self.staging,
+            "available": self.list_versions(),
+        }
+
+
+if __name__ == "__main__":
+    # Usage (from backend/): python -m models.bundle_manager <version>
+    # Writes bundle/versions/<version>/manifest.json
+    if len(sys.argv) != 2:
+        print("Usage: python -m models.bundle_manager <version>")
+        sys.exit(1)
+    version = sys.argv[1]
+    manifest = build_manifest(version)
+    out = Config.bundle_paths(version)["manifest"]
+    with open(out, "w") as f:
+        json.dump(manifest, f, indent=2)
+    print(f"Wrote {out}")
+    print(json.dumps(manifest, indent=2))
@@ -0,0 +1,249 @@
+# backend/models/dedup.py
+"""
+Offline near-duplicate detection and gallery index compaction.
+
+Finds clusters of near-identical gallery vectors with a batched FAISS
+self-search, keeps one representative per cluster and writes a new bundle
+version whose index only holds the representatives (under their original
+gallery ids) plus gallery_clusters.npy mapping every gallery id to its
+representative. The search route uses that table to collapse or expand
+duplicates at result time.
+
+Usage (from backend/):
+    python -m models.dedup --src legacy --dst v2-dedup --threshold 0.95
+"""
+import argparse
+import json
+import os
+import shutil
+import time
+
+import faiss
+import numpy as np
+
+from config import Config
+from models.bundle_manager import build_manifest
+
+
+def reconstruct_vectors(index) -> np.ndarray:
+    """Pull all stored vectors back out of a FAISS index"""
+    try:
+        return index.reconstruct_n(0, index.ntotal)
+    except RuntimeError:
+        # IVF indexes need a direct map before vectors can be reconstructed
+        faiss.extract_index_ivf(index).make_direct_map()
+        return index.reconstruct_n(0, index.ntotal)
+
+
+def _find(parent: np.ndarray, i: int) -> int:
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+
+def find_duplicate_clusters(vectors: np.ndarray, labels: list, threshold: float, k: int = 16,
+                            batch_size: int = 4096, same_label_only: bool = True) -> np.ndarray:
+    """
+    Group vectors whose cosine similarity is >= threshold.
+
+    Each vector is linked to its k nearest neighbours above the threshold
+    (union-find over those edges). With same_label_only, only shots of the
+    same item id are merged. Returns, for every vector, the id of its
+    cluster representative: the member closest to the cluster mean.
+    """
+    x = np.ascontiguousarray(vectors, dtype=np.float32).copy()
+    faiss.normalize_L2(x)
+    n, d = x.shape
+
+    flat = faiss.IndexFlatIP(d)
+    flat.add(x)
+    k = min(k + 1, n)
+
+    parent = np.arange(n)
+    for start in range(0, n, batch_size):
+        S, I = flat.search(x[start:start + batch_size], k)
+        for row, (sims, nbrs) in enumerate(zip(S, I)):
+            i = start + row
+            for sim, j in zip(sims, nbrs):
+                if sim < threshold:
+                    break
+                if j < 0 or j == i:
+                    continue
+                if same_label_only and labels[i] != labels[j]:
+                    continue
+                ri, rj = _find(parent, i), _find(parent, int(j))
+                if ri != rj:
+                    parent[max(ri, rj)] = min(ri, rj)
+
+    roots = np.array([_find(parent, i) for i in range(n)])
+    clusters = np.arange(n)
+    order = np.argsort(roots, kind="stable")
+    bounds = np.flatnonzero(np.diff(roots[order])) + 1
+    for members in np.split(order, bounds):
+        if len(members) == 1:
+            continue
+        centroid = x[members].mean(axis=0)
+        rep = members[int(np.argmax(x[members] @ centroid))]
+        clusters[members] = rep
+    return clusters
+
+
+def index_factory_string(index):
+    """
+    Factory string that rebuilds index's structure, or None if it is not recognised.
+
+    Covers the layouts this tool can reproduce: Flat, IVF<n>,Flat, IVF<n>,PQ<m>x<b>, PQ<m>x<b>, HNSW<m>.
+    """
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexFlat):
+        return "Flat"
+    if isinstance(index, faiss.IndexIVFFlat):
+        return f"IVF{index.nlist},Flat"
+    if isinstance(index, faiss.IndexIVFPQ):
+        return f"IVF{index.nlist},PQ{index.pq.M}x{index.pq.nbits}"
+    if isinstance(index, faiss.IndexPQ):
+        return f"PQ{index.pq.M}x{index.pq.nbits}"
+    if isinstance(index, faiss.IndexHNSWFlat):
+        return f"HNSW{index.hnsw.nb_neighbors(1)}"
+    return None
+
+
+def build_compacted_index(index, vectors: np.ndarray, clusters: np.ndarray):
+    """
+    Index over the representatives with the source's structure, keyed by their original gallery ids.
+
+    Trained structures (IVF, PQ) are retrained on the representatives; IVF nlist
+    is capped so every list still gets enough training points. Unrecognised
+    index types fall back to Flat with a warning. Returns (index, factory string).
+    """
+    reps = np.unique(clusters).astype(np.int64)
+    x = np.ascontiguousarray(vectors[reps], dtype=np.float32)
+    src = faiss.downcast_index(index)
+
+    factory = index_factory_string(index)
+    if factory is None:
+        print(f" WARNING: cannot rebuild {type(src).__name__}, compacted index falls back to Flat")
+        factory = "Flat"
+    elif isinstance(src, faiss.IndexIVF):
+        nlist = min(src.nlist, max(1, len(reps) // 39))
+        if nlist != src.nlist:
+            print(f" IVF nlist reduced {src.nlist} -> {nlist} for {len(reps)} representatives")
+            factory = factory.replace(f"IVF{src.nlist},", f"IVF{nlist},")
+
+    inner = faiss.index_factory(index.d, factory, index.metric_type)
+    if not inner.is_trained:
+        inner.train(x)
+
+    # Keep the source's search-time settings
+    if isinstance(src, faiss.IndexIVF):
+        ivf = faiss.extract_index_ivf(inner)
+        ivf.nprobe = min(src.nprobe, ivf.nlist)
+        # Direct map so stored vectors can be reconstructed (result cache rescoring)
+        ivf.make_direct_map()
+    if isinstance(src, faiss.IndexHNSWFlat):
+        faiss.downcast_index(inner).hnsw.efSearch = src.hnsw.efSearch
+
+    compacted = faiss.IndexIDMap(inner)
+    compacted.add_with_ids(x, reps)
+    return compacted, factory
+
+
+def _search_latency_ms(index, queries: np.ndarray, k: int, repeats: int = 3) -> float:
+    """Mean single-query search latency"""
+    best = float("inf")
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        for q in queries:
+            index.search(q.reshape(1, -1), k)
+        best = min(best, (time.perf_counter() - t0) / len(queries))
+    return best * 1000
+
+
+def _distinct_in_top_k(index, queries: np.ndarray, clusters: np.ndarray, k: int) -> float:
+    """Mean number of distinct clusters in the top-k of the original index"""
+    _, I = index.search(queries, k)
+    return float(np.mean([len(set(clusters[row[row >= 0]].tolist())) for row in I]))
+
+
+def compact(src: str, dst: str, threshold: float, k: int, batch_size: int, same_label_only: bool,
+            n_bench: int = 500) -> dict:
+    """Write bundle version dst as a compacted copy of src and return a size/latency report"""
+    src_paths = Config.bundle_paths(src)
+    dst_paths = Config.bundle_paths(dst)
+    if os.path.exists(dst_paths["root"]):
+        raise RuntimeError(f"Destination bundle already exists: {dst_paths['root']}")
+    if os.path.exists(src_paths["clusters"]):
+        raise RuntimeError(f"Source bundle {src} is already compacted")
+
+    print(f"Loading {src_paths['faiss']}...")
+    index = faiss.read_index(src_paths["faiss"])
+    labels = np.load(src_paths["labels"], allow_pickle=True)
+    paths = np.load(src_paths["paths"], allow_pickle=True)
+    vectors = reconstruct_vectors(index)
+    print(f"Gallery: {index.ntotal} vectors, dim {index.d}")
+
+    t0 = time.time()
+    clusters = find_duplicate_clusters(vectors, labels.tolist(), threshold, k, batch_size, same_label_only)
+    print(f"Clustering: {time.time() - t0:.2f}s")
+
+    compacted, factory = build_compacted_index(index, vectors, clusters)
+
+    # Write the new bundle: model is copied as is, metadata keeps every gallery image
+    shutil.copytree(os.path.join(src_paths["root"], "model"), os.path.join(dst_paths["root"], "model"))
+    os.makedirs(os.path.dirname(dst_paths["faiss"]), exist_ok=True)
+    faiss.write_index(compacted, dst_paths["faiss"])
+    np.save(dst_paths["labels"], labels)
+    np.save(dst_paths["paths"], paths)
+    np.save(dst_paths["clusters"], clusters)
+    with open(dst_paths["manifest"], "w") as f:
+        json.dump(build_manifest(dst), f, indent=2)
+
+    # Report: size, latency and how many distinct items a top-k used to show
+    rng = np.random.default_rng(0)
+    queries = np.ascontiguousarray(vectors[rng.choice(len(vectors), min(n_bench, len(vectors)), replace=False)])
+    report = {
+        "src": src,
+        "dst": dst,
+        "threshold": threshold,
+        "same_label_only": same_label_only,
+        "src_index_type": type(faiss.downcast_index(index)).__name__,
+        "src_factory": index_factory_string(index),
+        "dst_factory": factory,
+        "gallery_size": int(index.ntotal),
+        "representatives": int(compacted.ntotal),
+        "clusters_with_duplicates": int(np.count_nonzero(np.unique(clusters, return_counts=True)[1] > 1)),
+        # File sizes: the in-memory source may have gained a direct map in reconstruct_vectors
+        "index_bytes_before": os.path.getsize(src_paths["faiss"]),
+        "index_bytes_after": os.path.getsize(dst_paths["faiss"]),
+        "search_ms_before": _search_latency_ms(index, queries, Config.DEFAULT_K),
+        "search_ms_after": _search_latency_ms(compacted, queries, Config.DEFAULT_K),
+        f"distinct_items_top{Config.DEFAULT_K}_before": _distinct_in_top_k(index, queries, clusters, Config.DEFAULT_K),
+    }
+    with open(os.path.join(dst_paths["root"], "compaction_report.json"), "w") as f:
+        json.dump(report, f, indent=2)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compact a gallery index by collapsing near-duplicates")
+    parser.add_argument("--src", default=Config.initial_version(), help="source bundle version")
+    parser.add_argument("--dst", required=True, help="new bundle version to write")
+    parser.add_argument("--threshold", type=float, default=0.95, help="cosine similarity to count as duplicate")
+    parser.add_argument("--k", type=int, default=16, help="neighbours checked per vector")
+    parser.add_argument("--batch-size", type=int, default=4096)
+    parser.add_argument("--any-label", action="store_true", help="also merge shots of different item ids")
+    args = parser.parse_args()
+
+    report = compact(args.src, args.dst, args.threshold, args.k, args.batch_size, not args.any_label)
+
+    print("=" * 50)
+    print(f" Gallery {report['gallery_size']} -> {report['representatives']} vectors "
+          f"({report['clusters_with_duplicates']} duplicate clusters)")
+    print(f" Index size: {report['index_bytes_before'] / 1e6:.2f} MB -> {report['index_bytes_after'] / 1e6:.2f} MB")
+    print(f" Search latency: {report['search_ms_before']:.3f} ms -> {report['search_ms_after']:.3f} ms")
+    print("=" * 50)
+
+
+if __name__ == "__main__":
+    main()
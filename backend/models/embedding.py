@@ -33,14 +33,14 @@ class EmbeddingModel:
         self.transform = None
         self.emb_dim = 128
     
-    def load(self):
+    def load(self, arch_path: str = None, weights_path: str = None):
         """Load model architecture and weights from bundle"""
         try:
             self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
             print(f"Using device: {self.device}")
             
             # Load architecture config
-            arch_path = Config.MODEL_ARCH_PATH
+            arch_path = arch_path or Config.MODEL_ARCH_PATH
             print(f"Loading architecture from {arch_path}...")
             with open(arch_path, 'r') as f:
                 arch_config = json.load(f)
@@ -59,7 +59,7 @@ class EmbeddingModel:
             self.model = DinoEmbeddingNet(backbone, proj_dim=self.emb_dim)
             
             # Load trained weights
-            weights_path = Config.MODEL_WEIGHTS_PATH
+            weights_path = weights_path or Config.MODEL_WEIGHTS_PATH
             print(f"Loading trained weights from {weights_path}...")
             if os.path.exists(weights_path):
                 checkpoint = torch.load(weights_path, map_location=self.device)
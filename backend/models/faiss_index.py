@@ -1,4 +1,5 @@
 # backend/models/faiss_index.py
+import os
 import numpy as np
 import faiss
 from config import Config
@@ -12,22 +13,41 @@ class FAISSIndex:
         self.labels = None
         self.paths = None
         self.ntotal = 0
+        self.gallery_size = 0
+        self.members = None
+        self._rows = None
     
-    def load(self, emb_dim: int):
+    def load(self, emb_dim: int, faiss_path: str = None, labels_path: str = None, paths_path: str = None,
+             clusters_path: str = None):
         """Load FAISS index and metadata"""
-        print(f"Loading FAISS index from {Config.FAISS_PATH}...")
+        faiss_path = faiss_path or Config.FAISS_PATH
+        labels_path = labels_path or Config.LABELS_PATH
+        paths_path = paths_path or Config.PATHS_PATH
+        clusters_path = clusters_path or Config.CLUSTERS_PATH
+        print(f"Loading FAISS index from {faiss_path}...")
         
         try:
-            self.index = faiss.read_index(Config.FAISS_PATH)
+            self.index = faiss.read_index(faiss_path)
             
             print(f"Index dim: {self.index.d}, emb_dim: {emb_dim}")
             if self.index.d != emb_dim:
                 raise ValueError(f"Dimension mismatch! Index is {self.index.d}-dim but model outputs {emb_dim}-dim")
             
             # Load metadata
-            self.labels = np.load(Config.LABELS_PATH, allow_pickle=True).tolist()
-            self.paths = np.load(Config.PATHS_PATH, allow_pickle=True).tolist()
+            self.labels = np.load(labels_path, allow_pickle=True).tolist()
+            self.paths = np.load(paths_path, allow_pickle=True).tolist()
             self.ntotal = self.index.ntotal
+            self.gallery_size = len(self.paths)
+            
+            # Compacted index: ids are original gallery ids, clusters maps each gallery id to its representative
+            if os.path.exists(clusters_path):
+                clusters = np.load(clusters_path)
+                if len(clusters) != self.gallery_size:
+                    raise ValueError(f"Cluster table has {len(clusters)} rows but gallery has {self.gallery_size}")
+                self.members = {}
+                for idx, rep in enumerate(clusters.tolist()):
+                    self.members.setdefault(rep, []).append(idx)
+                print(f"Duplicate clusters loaded: {self.gallery_size} images -> {len(self.members)} representatives")
             
             print(f"Index & metadata loaded. ntotal = {self.ntotal}")
         except Exception as e:
@@ -40,6 +60,23 @@ class FAISSIndex:
         D, I = self.index.search(query_embedding, k)
         return D, I
     
+    def get_vectors(self, ids) -> np.ndarray:
+        """Reconstruct stored vectors for gallery ids (also works on IndexIDMap)"""
+        index = self.index
+        if hasattr(index, "id_map"):
+            if self._rows is None:
+                self._rows = {int(i): row for row, i in enumerate(faiss.vector_to_array(index.id_map))}
+            index = faiss.downcast_index(index.index)
+            ids = [self._rows[int(i)] for i in ids]
+        return np.vstack([index.reconstruct(int(i)) for i in ids])
+    
+    def get_members(self, idx: int) -> list:
+        """Get gallery ids collapsed into representative idx (idx itself first)"""
+        if self.members is None:
+            return [idx]
+        members = self.members.get(idx, [idx])
+        return [idx] + [m for m in members if m != idx]
+    
     def get_label(self, idx: int) -> str:
         """Get label for index"""
         return str(self.labels[idx])
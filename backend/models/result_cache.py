@@ -0,0 +1,174 @@
+# backend/models/result_cache.py
+"""
+Approximate semantic result cache.
+
+Crops and recompressions of the same catalog photo encode to nearly the
+same embedding, so their top-k lists are (almost) identical. Query
+embeddings are SimHash-bucketed (random hyperplanes); a lookup probes the
+query's bucket plus the buckets across its least certain bits, and reuses
+the closest cached query within RESULT_CACHE_MAX_DISTANCE cosine distance.
+In "rescore" mode the cached candidates are re-scored against the new
+query instead of being served verbatim.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+import faiss
+import numpy as np
+
+
+class CacheEntry:
+    """One cached search: query embedding, raw candidates and built results"""
+
+    def __init__(self, embedding: np.ndarray, k: int, duplicates: str, version: str,
+                 D: np.ndarray, I: np.ndarray, results: list, vectors: np.ndarray = None):
+        self.embedding = embedding
+        self.k = k
+        self.duplicates = duplicates
+        self.version = version
+        self.D = D
+        self.I = I
+        self.results = results
+        self.vectors = vectors
+        self.created_at = time.time()
+        self.bucket = None
+        self.nbytes = self._estimate_bytes()
+
+    def _estimate_bytes(self) -> int:
+        size = self.embedding.nbytes + self.D.nbytes + self.I.nbytes + 512
+        if self.vectors is not None:
+            size += self.vectors.nbytes
+        for r in self.results:
+            size += 400 + len(r["path"]) + len(r["label"]) + len(r["thumb_url"])
+        return size
+
+
+class SemanticResultCache:
+    """Byte-bounded LRU of search results, looked up by embedding similarity"""
+
+    def __init__(self, max_bytes: int, max_distance: float, n_bits: int = 16, n_probes: int = 2, seed: int = 0):
+        self.max_bytes = max_bytes
+        self.max_distance = max_distance
+        self.n_bits = n_bits
+        self.n_probes = n_probes
+        self.seed = seed
+        self.planes = None
+        self._weights = 1 << np.arange(n_bits, dtype=np.int64)
+        self._entries = OrderedDict()
+        self._buckets = {}
+        self._next_id = 0
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._hit_age_total = 0.0
+        self._hit_age_max = 0.0
+        self._hit_distance_total = 0.0
+
+    def _buckets_for(self, q: np.ndarray) -> list:
+        """Query bucket first, then buckets with one of the least certain bits flipped (caller holds _lock)"""
+        q = q.reshape(-1)
+        if self.planes is None or self.planes.shape[0] != q.size:
+            # Hyperplanes follow the embedding dim, which can change with a new bundle
+            self.planes = np.random.default_rng(self.seed).standard_normal((q.size, self.n_bits)).astype(np.float32)
+        proj = q @ self.planes
+        bits = proj > 0
+        key = int(bits @ self._weights)
+        keys = [key]
+        for bit in np.argsort(np.abs(proj))[:self.n_probes]:
+            keys.append(key ^ int(self._weights[bit]))
+        return keys
+
+    def lookup(self, q: np.ndarray, k: int, duplicates: str, version: str):
+        """Closest cached entry within max_distance that can serve this query, or None"""
+        q = q.reshape(-1)
+        best, best_dist = None, self.max_distance
+        with self._lock:
+            for bucket in self._buckets_for(q):
+                for entry_id in self._buckets.get(bucket, ()):
+                    entry = self._entries[entry_id]
+                    if entry.version != version or entry.duplicates != duplicates or entry.k < k:
+                        continue
+                    dist = 1.0 - float(q @ entry.embedding)
+                    if dist <= best_dist:
+                        best, best_dist, best_id = entry, dist, entry_id
+
+            if best is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(best_id)
+            age = time.time() - best.created_at
+            self.hits += 1
+            self._hit_age_total += age
+            self._hit_age_max = max(self._hit_age_max, age)
+            self._hit_distance_total += best_dist
+            return best
+
+    def insert(self, entry: CacheEntry):
+        """Add an entry, evicting least recently used entries past max_bytes"""
+        if entry.nbytes > self.max_bytes:
+            return
+        with self._lock:
+            # Hash under the lock so planes can't be regenerated between hashing and lookup
+            bucket = self._buckets_for(entry.embedding)[0]
+            entry_id = self._next_id
+            self._next_id += 1
+            entry.bucket = bucket
+            self._entries[entry_id] = entry
+            self._buckets.setdefault(bucket, []).append(entry_id)
+            self._bytes += entry.nbytes
+            while self._bytes > self.max_bytes:
+                old_id, old = self._entries.popitem(last=False)
+                self._drop(old_id, old)
+                self.evictions += 1
+
+    def _drop(self, entry_id: int, entry: CacheEntry):
+        ids = self._buckets[entry.bucket]
+        ids.remove(entry_id)
+        if not ids:
+            del self._buckets[entry.bucket]
+        self._bytes -= entry.nbytes
+
+    def invalidate(self, version: str = None):
+        """Drop everything (called when the active index changes)"""
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+            self._bytes = 0
+            self.invalidations += 1
+        print(f" Result cache invalidated (active bundle: {version})")
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "mean_hit_age_s": self._hit_age_total / self.hits if self.hits else 0.0,
+                "max_hit_age_s": self._hit_age_max,
+                "mean_hit_distance": self._hit_distance_total / self.hits if self.hits else 0.0,
+            }
+
+
+def rescore(entry: CacheEntry, q: np.ndarray, metric_type: int, k: int) -> tuple:
+    """Re-rank a cached candidate list against a new query, returning FAISS-shaped (D, I)"""
+    ids = entry.I[0][entry.I[0] >= 0]
+    if metric_type == faiss.METRIC_INNER_PRODUCT:
+        scores = entry.vectors @ q.reshape(-1)
+        order = np.argsort(-scores)
+    else:
+        scores = ((entry.vectors - q.reshape(1, -1)) ** 2).sum(axis=1)
+        order = np.argsort(scores)
+    order = order[:k]
+    return scores[order].reshape(1, -1).astype(np.float32), ids[order].reshape(1, -1)
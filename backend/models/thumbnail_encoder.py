@@ -0,0 +1,215 @@
+# backend/models/thumbnail_encoder.py
+"""
+Thumbnail encoding: Accept-header format negotiation (AVIF / WebP /
+progressive JPEG), a dedicated bounded encoder pool so encodes don't hold a
+request threadpool slot, and an LRU cache of encoded bytes keyed by
+(path, size, format).
+
+Benchmark (from backend/):
+    python -m models.thumbnail_encoder --n 200
+"""
+import argparse
+import asyncio
+import io
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+from config import Config
+
+# AVIF is built into Pillow >= 11.3; older Pillow needs the optional pillow-avif-plugin
+try:
+    import pillow_avif  # noqa: F401
+except ImportError:
+    pass
+
+Image.init()
+
+MEDIA_TYPES = {
+    "avif": "image/avif",
+    "webp": "image/webp",
+    "jpeg": "image/jpeg",
+}
+
+AVAILABLE_FORMATS = [
+    fmt for fmt in Config.THUMBNAIL_FORMATS
+    if fmt in MEDIA_TYPES and (fmt == "jpeg" or fmt.upper() in Image.SAVE)
+]
+if "jpeg" not in AVAILABLE_FORMATS:
+    AVAILABLE_FORMATS.append("jpeg")
+
+print(f" Thumbnail formats available: {AVAILABLE_FORMATS}")
+
+# Dedicated encoder pool; the semaphore bounds queued + running encodes
+_executor = ThreadPoolExecutor(max_workers=Config.THUMBNAIL_ENCODER_WORKERS, thread_name_prefix="thumb-encoder")
+_slots = None
+
+
+class EncoderBusy(RuntimeError):
+    """All encoder slots (running + queued) are taken"""
+
+
+def negotiate_format(accept: str) -> str:
+    """
+    Pick a thumbnail format from the Accept header.
+
+    AVIF and WebP must be listed explicitly (browsers that support them do);
+    JPEG is also served for image/* and */* and is the fallback. Ties on
+    q-value go to the earliest format in THUMBNAIL_FORMATS.
+    """
+    weights = {}
+    for part in (accept or "").split(","):
+        fields = part.strip().split(";")
+        mime = fields[0].strip().lower()
+        q = 1.0
+        for param in fields[1:]:
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        weights[mime] = q
+
+    best, best_q = "jpeg", 0.0
+    for fmt in AVAILABLE_FORMATS:
+        q = weights.get(MEDIA_TYPES[fmt])
+        if q is None and fmt == "jpeg":
+            q = weights.get("image/*", weights.get("*/*"))
+        if q is not None and q > best_q:
+            best, best_q = fmt, q
+    return best
+
+
+def _resize_image(img: Image.Image, max_side: int) -> Image.Image:
+    """Resize image if needed"""
+    w, h = img.size
+    if max(w, h) > max_side:
+        scale = max_side / max(w, h)
+        img = img.resize((int(w * scale), int(h * scale)))
+    return img
+
+
+def encode(img: Image.Image, fmt: str, max_side: int) -> bytes:
+    """Resize and encode an image (runs on the encoder pool)"""
+    img = _resize_image(img, max_side)
+    buf = io.BytesIO()
+    if fmt == "avif":
+        img.save(buf, format="AVIF", quality=Config.THUMBNAIL_AVIF_QUALITY, speed=8)
+    elif fmt == "webp":
+        img.save(buf, format="WEBP", quality=Config.THUMBNAIL_WEBP_QUALITY, method=4)
+    else:
+        img.save(buf, format="JPEG", quality=Config.THUMBNAIL_QUALITY, progressive=True, optimize=True)
+    return buf.getvalue()
+
+
+async def encode_async(img: Image.Image, fmt: str, max_side: int) -> bytes:
+    """Encode on the dedicated pool; raises EncoderBusy instead of queueing past its bound"""
+    global _slots
+    if _slots is None:
+        _slots = asyncio.Semaphore(Config.THUMBNAIL_ENCODER_WORKERS * 4)
+    if _slots.locked():
+        raise EncoderBusy("Thumbnail encoder pool is saturated")
+    async with _slots:
+        return await asyncio.wrap_future(_executor.submit(encode, img, fmt, max_side))
+
+
+class ThumbnailCache:
+    """Thread-safe, byte-bounded LRU cache of encoded thumbnails keyed by (path, max_side, format)"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple):
+        with self._lock:
+            data = self._data.get(key)
+            if data is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def put(self, key: tuple, data: bytes):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old)
+            self._data[key] = data
+            self._bytes += len(data)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._data.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def info(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "currsize": len(self._data),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+thumbnail_cache = ThumbnailCache(Config.THUMBNAIL_CACHE_MAX_BYTES)
+
+
+def benchmark(n: int, max_side: int) -> dict:
+    """Compare bytes and encode time per format over the first n gallery images"""
+    import numpy as np
+    from models.lazy_loader import load_image
+
+    paths = np.load(Config.bundle_paths(Config.initial_version())["paths"], allow_pickle=True).tolist()[:n]
+    images = []
+    for path in paths:
+        local = os.path.join(Config.BUNDLE_DIR, str(path))
+        images.append(Image.open(local).convert("RGB") if os.path.exists(local) else load_image(str(path)))
+
+    report = {}
+    baseline = ("jpeg-baseline", lambda img: _baseline_jpeg(img, max_side))
+    candidates = [baseline] + [(fmt, lambda img, fmt=fmt: encode(img, fmt, max_side)) for fmt in AVAILABLE_FORMATS]
+    for name, fn in candidates:
+        sizes, times = [], []
+        for img in images:
+            t0 = time.perf_counter()
+            data = fn(img)
+            times.append(time.perf_counter() - t0)
+            sizes.append(len(data))
+        report[name] = {
+            "mean_bytes": float(np.mean(sizes)),
+            "mean_encode_ms": float(np.mean(times) * 1000),
+        }
+    return report
+
+
+def _baseline_jpeg(img: Image.Image, max_side: int) -> bytes:
+    """The previous encoding: baseline JPEG at THUMBNAIL_QUALITY"""
+    buf = io.BytesIO()
+    _resize_image(img, max_side).save(buf, format="JPEG", quality=Config.THUMBNAIL_QUALITY)
+    return buf.getvalue()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark thumbnail bytes and encode time per format")
+    parser.add_argument("--n", type=int, default=200, help="number of gallery images")
+    parser.add_argument("--max-side", type=int, default=Config.THUMBNAIL_MAX_SIZE)
+    args = parser.parse_args()
+
+    report = benchmark(args.n, args.max_side)
+    base = report["jpeg-baseline"]["mean_bytes"]
+    print("=" * 50)
+    print(f" {'format':<14}{'bytes':>10}{'vs baseline':>13}{'encode ms':>11}")
+    for name, r in report.items():
+        print(f" {name:<14}{r['mean_bytes']:>10.0f}{r['mean_bytes'] / base:>12.0%}{r['mean_encode_ms']:>11.2f}")
+    print("=" * 50)
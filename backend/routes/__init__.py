@@ -8,5 +8,7 @@ backend/
     __init__.py    - This makes routes a package
     search.py
     health.py
+    thumbnails.py
+    admin.py
 
 '''
@@ -0,0 +1,58 @@
+# backend/routes/admin.py
+import hmac
+from fastapi import APIRouter, BackgroundTasks, Header, HTTPException
+from config import Config
+
+# Will be injected by main.py
+bundle_manager = None
+
+router = APIRouter(prefix="/api/admin", tags=["admin"])
+
+
+def _check_token(token: str):
+    """Admin endpoints are disabled unless ADMIN_TOKEN is set"""
+    if not Config.ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints disabled (ADMIN_TOKEN not set)")
+    if not token or not hmac.compare_digest(token.encode(), Config.ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+
+@router.get("/bundles")
+def bundles(x_admin_token: str = Header(None)):
+    """Active, previous, staging and on-disk bundle versions"""
+    _check_token(x_admin_token)
+    return bundle_manager.status()
+
+
+@router.post("/bundles/{version}/activate")
+def activate(version: str, background_tasks: BackgroundTasks, x_admin_token: str = Header(None)):
+    """Load a bundle version in the background, warm it up and swap it in"""
+    _check_token(x_admin_token)
+
+    if version not in bundle_manager.list_versions():
+        raise HTTPException(status_code=404, detail=f"Unknown bundle version: {version}")
+    if version == bundle_manager.active_version:
+        raise HTTPException(status_code=409, detail=f"Bundle {version} is already active")
+    if bundle_manager.is_loading:
+        raise HTTPException(status_code=409, detail="Another bundle is already loading")
+
+    print(f"\n Admin: staging bundle {version}")
+    background_tasks.add_task(bundle_manager.stage, version)
+    return {"accepted": True, "version": version, "active": bundle_manager.active_version}
+
+
+@router.post("/bundles/rollback")
+def rollback(x_admin_token: str = Header(None)):
+    """Swap the previous bundle back in"""
+    _check_token(x_admin_token)
+
+    if bundle_manager.is_loading:
+        raise HTTPException(status_code=409, detail="A bundle is loading, try again once it is active")
+
+    try:
+        version = bundle_manager.rollback()
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    print(f"\n Admin: rolled back to bundle {version}")
+    return {"active": version}
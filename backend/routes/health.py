@@ -1,9 +1,11 @@
 # backend/routes/health.py
 from fastapi import APIRouter
 from config import Config
+from models.thumbnail_encoder import thumbnail_cache
 
 # Will be injected by main.py
-faiss_index = None
+bundle_manager = None
+result_cache = None
 
 router = APIRouter(prefix="/api", tags=["health"])
 
@@ -11,9 +13,15 @@ router = APIRouter(prefix="/api", tags=["health"])
 @router.get("/health")
 def health():
     """Health check endpoint"""
+    with bundle_manager.acquire() as bundle:
+        ntotal = int(bundle.faiss_index.ntotal)
+        version = bundle.version
     return {
         "ok": True,
-        "ntotal": int(faiss_index.ntotal),
+        "ntotal": ntotal,
+        "version": version,
         "device": str(Config.DEVICE),
         "storage": "s3" if Config.USE_S3 else ("huggingface" if Config.USE_HUGGINGFACE else "local"),
+        "result_cache": result_cache.stats() if result_cache else None,
+        "thumbnail_cache": thumbnail_cache.info(),
     }
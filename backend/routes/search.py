@@ -3,51 +3,80 @@ from fastapi import APIRouter, UploadFile, File, Form, HTTPException
 from PIL import Image
 import io
 import numpy as np
+from config import Config
+from models.result_cache import CacheEntry, rescore
 
-# These will be injected by main.py
-embedding_model = None
-faiss_index = None
+# Will be injected by main.py
+bundle_manager = None
+result_cache = None
 
 router = APIRouter(prefix="/api", tags=["search"])
 
 
-def build_results(D: np.ndarray, I: np.ndarray, k: int) -> list:
-    """Build search results"""
+def build_results(faiss_index, D: np.ndarray, I: np.ndarray, k: int, version: str = None,
+                  duplicates: str = "collapse") -> list:
+    """
+    Build search results.
+
+    On a compacted index each hit is a cluster representative. "collapse" returns
+    one result per cluster with a duplicate_count; "expand" lists the cluster's
+    near-duplicates right after it (same score, duplicate_of set), up to k results.
+    """
     print(f"\n Building results for k={k}")
     print(f"D shape: {D.shape}, I shape: {I.shape}")
     print(f"Top indices: {I[0][:k]}")
     print(f"Top scores: {D[0][:k]}")
     
+    query = f"?v={version}" if version else ""
     results = []
-    for rank, idx in enumerate(I[0][:k], start=1):
+    for hit, idx in enumerate(I[0][:k]):
         idx = int(idx)
-        label = faiss_index.get_label(idx)
-        path = faiss_index.get_path(idx)
-        score = float(D[0][rank - 1])
-        
-        print(f"   [{rank}] ID={idx}, Label={label}, Score={score:.4f}, Path={path}")
+        if idx < 0:
+            break
+        score = float(D[0][hit])
+        members = faiss_index.get_members(idx)
+        ids = members if duplicates == "expand" else [idx]
         
-        results.append({
-            "rank": rank,
-            "id": idx,
-            "label": label,
-            "path": path,
-            "thumb_url": f"/api/thumb/{idx}",
-            "score": score,
-        })
+        for member in ids:
+            if len(results) >= k:
+                break
+            label = faiss_index.get_label(member)
+            path = faiss_index.get_path(member)
+            rank = len(results) + 1
+            
+            print(f"   [{rank}] ID={member}, Label={label}, Score={score:.4f}, Path={path}")
+            
+            result = {
+                "rank": rank,
+                "id": member,
+                "label": label,
+                "path": path,
+                "thumb_url": f"/api/thumb/{member}{query}",
+                "score": score,
+            }
+            if faiss_index.members is not None:
+                if member == idx:
+                    result["duplicate_count"] = len(members) - 1
+                else:
+                    result["duplicate_of"] = idx
+            results.append(result)
         
     print(f"Built {len(results)} results\n")
     return results
 
 
 @router.post("/search-image")
-async def search_image(file: UploadFile = File(...), k: int = Form(5)):
+async def search_image(file: UploadFile = File(...), k: int = Form(5), duplicates: str = Form(None)):
     """Search for similar images"""
     print(f"\n Search request: k={k}")
     
     if file is None:
         raise HTTPException(status_code=400, detail="No file uploaded")
     
+    duplicates = (duplicates or Config.DUPLICATES_MODE).lower()
+    if duplicates not in ("collapse", "expand"):
+        raise HTTPException(status_code=400, detail="duplicates must be 'collapse' or 'expand'")
+    
     try:
         print(f"Reading file: {file.filename}")
         data = await file.read()
@@ -59,29 +88,60 @@ async def search_image(file: UploadFile = File(...), k: int = Form(5)):
         print(f"Image read ERROR: {e}")
         raise HTTPException(status_code=400, detail="Invalid image file")
     
-    # Encode image
-    try:
-        print(f"Encoding image...")
-        q = embedding_model.encode(pil)
-        print(f"Embedding shape: {q.shape}, dtype: {q.dtype}")
-    except Exception as e:
-        print(f"Encoding ERROR: {e}")
-        raise HTTPException(status_code=500, detail=f"Encoding failed: {str(e)}")
-    
-    # Search FAISS index
-    try:
-        print(f"Searching FAISS index...")
-        D, I = faiss_index.search(q, k)
-        print(f"Found distances: {D[0]}, indices: {I[0]}")
-    except Exception as e:
-        print(f"FAISS search ERROR: {e}")
-        raise HTTPException(status_code=500, detail=f"Search failed: {str(e)}")
-    
-    # Build results
-    try:
-        results = build_results(D, I, k)
-    except Exception as e:
-        print(f" Result building ERROR: {e}")
-        raise HTTPException(status_code=500, detail=f"Result building failed: {str(e)}")
+    # Pin one bundle version for the whole request so a hot-swap can't mix model and index
+    with bundle_manager.acquire() as bundle:
+        # Encode image
+        try:
+            print(f"Encoding image...")
+            q = bundle.embedding_model.encode(pil)
+            print(f"Embedding shape: {q.shape}, dtype: {q.dtype}")
+        except Exception as e:
+            print(f"Encoding ERROR: {e}")
+            raise HTTPException(status_code=500, detail=f"Encoding failed: {str(e)}")
+        
+        # Reuse results of a near-identical earlier query
+        cached = result_cache.lookup(q, k, duplicates, bundle.version) if result_cache else None
+        if cached is not None and (Config.RESULT_CACHE_MODE != "rescore" or cached.vectors is None):
+            print("Result cache hit (reuse)")
+            return {"results": cached.results[:k], "version": bundle.version, "cache": "hit"}
+        
+        # Search FAISS index (or re-score a cached candidate list)
+        try:
+            if cached is not None:
+                print(f"Result cache hit (rescore {cached.vectors.shape[0]} candidates)")
+                D, I = rescore(cached, q, bundle.faiss_index.index.metric_type, k)
+            else:
+                print(f"Searching FAISS index...")
+                D, I = bundle.faiss_index.search(q, k)
+            print(f"Found distances: {D[0]}, indices: {I[0]}")
+        except Exception as e:
+            print(f"FAISS search ERROR: {e}")
+            raise HTTPException(status_code=500, detail=f"Search failed: {str(e)}")
+        
+        # Build results
+        try:
+            results = build_results(bundle.faiss_index, D, I, k, bundle.version, duplicates)
+        except Exception as e:
+            print(f" Result building ERROR: {e}")
+            raise HTTPException(status_code=500, detail=f"Result building failed: {str(e)}")
+        
+        if cached is None and result_cache is not None:
+            _cache_results(bundle, q, k, duplicates, D, I, results)
     
-    return {"results": results}
+    if result_cache is None:
+        cache_status = "disabled"
+    else:
+        cache_status = "hit" if cached is not None else "miss"
+    return {"results": results, "version": bundle.version, "cache": cache_status}
+
+
+def _cache_results(bundle, q: np.ndarray, k: int, duplicates: str, D: np.ndarray, I: np.ndarray, results: list):
+    """Store a fresh search in the result cache (with candidate vectors for rescoring)"""
+    vectors = None
+    if Config.RESULT_CACHE_MODE == "rescore":
+        try:
+            vectors = bundle.faiss_index.get_vectors(I[0][I[0] >= 0])
+        except Exception as e:
+            # e.g. IVF index without a direct map: fall back to verbatim reuse
+            print(f"Result cache: cannot reconstruct candidates ({e}), caching for reuse only")
+    result_cache.insert(CacheEntry(q.reshape(-1).copy(), k, duplicates, bundle.version, D, I, results, vectors))
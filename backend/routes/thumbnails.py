@@ -1,14 +1,16 @@
 # backend/routes/thumbnails.py
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, Header, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response
 from PIL import Image
 import io
 import os
 from config import Config
 from models.lazy_loader import load_image, get_cache_info
+from models.thumbnail_encoder import MEDIA_TYPES, EncoderBusy, encode_async, negotiate_format, thumbnail_cache
 
 # Will be injected by main.py
-faiss_index = None
+bundle_manager = None
 
 router = APIRouter(prefix="/api", tags=["thumbnails"])
 
@@ -20,40 +22,64 @@ if Config.USE_S3:
 
 
 @router.get("/thumb/{idx}")
-def thumb(idx: int, max_side: int = None):
-    """Get thumbnail for image with LRU cache info"""
+async def thumb(idx: int, max_side: int = None, v: str = None, accept: str = Header(None)):
+    """Get thumbnail for image in the best format the client accepts"""
+    # Clamp client-controlled size: it is part of the cache key
     if max_side is None:
         max_side = Config.THUMBNAIL_MAX_SIZE
+    max_side = max(16, min(max_side, Config.THUMBNAIL_MAX_SIZE))
     
-    if idx < 0 or idx >= faiss_index.ntotal:
-        raise HTTPException(status_code=404, detail="Index out of range")
+    # v pins the bundle version the result ids came from
+    try:
+        with bundle_manager.acquire(v) as bundle:
+            if idx < 0 or idx >= bundle.faiss_index.gallery_size:
+                raise HTTPException(status_code=404, detail="Index out of range")
+            path = bundle.faiss_index.get_path(idx)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Bundle version not loaded: {v}")
+    
+    fmt = negotiate_format(accept)
+    print(f"\n Thumbnail request: idx={idx}, path={path}, format={fmt}")
+    # Unversioned URLs can point at a different image after a bundle swap, so only v= URLs are long-lived
+    headers = {"Vary": "Accept", "Cache-Control": "public, max-age=86400" if v else "no-cache"}
     
-    path = faiss_index.get_path(idx)
-    print(f"\n Thumbnail request: idx={idx}, path={path}")
+    key = (path, max_side, fmt)
+    data = thumbnail_cache.get(key)
+    if data is not None:
+        return Response(content=data, media_type=MEDIA_TYPES[fmt], headers=headers)
     
     try:
-        if Config.USE_S3:
-            img = _load_from_s3(path)
-        else:
-            # Load from HuggingFace with LRU cache
-            img = load_image(path)
-            cache_info = get_cache_info()
-            print(f" LRU Cache - Hits: {cache_info['hits']}, Misses: {cache_info['misses']}, Size: {cache_info['currsize']}/{cache_info['maxsize']}")
+        img = await run_in_threadpool(_open_image, path)
     except HTTPException:
         raise
     except Exception as e:
         print(f"   Error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to open image: {str(e)}")
     
-    # Resize if needed
-    img = _resize_image(img, max_side)
+    # Resize + encode on the dedicated encoder pool
+    try:
+        data = await encode_async(img, fmt, max_side)
+    except EncoderBusy as e:
+        print(f"   {str(e)}")
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except Exception as e:
+        print(f"   Encode error ({fmt}): {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to encode thumbnail: {str(e)}")
+    thumbnail_cache.put(key, data)
     
-    # Convert to JPEG
-    buf = io.BytesIO()
-    img.save(buf, format="JPEG", quality=Config.THUMBNAIL_QUALITY)
-    buf.seek(0)
+    return Response(content=data, media_type=MEDIA_TYPES[fmt], headers=headers)
+
+
+def _open_image(path: str) -> Image.Image:
+    """Load source image (blocking I/O, run off the event loop)"""
+    if Config.USE_S3:
+        return _load_from_s3(path)
     
-    return StreamingResponse(buf, media_type="image/jpeg")
+    # Load from HuggingFace with LRU cache
+    img = load_image(path)
+    cache_info = get_cache_info()
+    print(f" LRU Cache - Hits: {cache_info['hits']}, Misses: {cache_info['misses']}, Size: {cache_info['currsize']}/{cache_info['maxsize']}")
+    return img
 
 
 def _load_from_s3(path: str) -> Image.Image:
@@ -81,11 +107,3 @@ def _load_from_local(path: str) -> Image.Image:
     """Load image using lazy loader (HF on-demand or local)"""
     return load_image(path)
 
-
-def _resize_image(img: Image.Image, max_side: int) -> Image.Image:
-    """Resize image if needed"""
-    w, h = img.size
-    if max(w, h) > max_side:
-        scale = max_side / max(w, h)
-        img = img.resize((int(w * scale), int(h * scale)))
-    return img